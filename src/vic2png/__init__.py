@@ -4,6 +4,6 @@ Script and Python function to enable converting raw raster files (.VIC/.IMG)
 to standard compressed image formats.
 """
 
-from .convert import vic2png
+from .convert import vic2png, vic2png_many
 
-__all__ = ["vic2png"]
+__all__ = ["vic2png", "vic2png_many"]
@@ -1,11 +1,19 @@
 """CLI frontend for converting images."""
 
 import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 from vic2png import vic2png
 
 
+def setup_logging() -> None:
+    """Print vic2png's log messages to the console without any decoration."""
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+
+
 def main() -> None:
     """
     Main function for vic2png to be run as a script. Set up as a console script
@@ -15,8 +23,9 @@ def main() -> None:
     parser.add_argument(
         "source",
         type=Path,
+        nargs="+",
         metavar="FILE",
-        help="Vicar or PDS .VIC/.IMG format file to be converted",
+        help="Vicar or PDS .VIC/.IMG format file(s) to be converted",
     )
     parser.add_argument(
         "-o", "--out", type=Path, help="Output directory or whole filename"
@@ -38,23 +47,67 @@ def main() -> None:
         type=int,
         help="Min. DN value to clip the lower bound of data in the input image.",
     )
+    parser.add_argument(
+        "--autoscale",
+        choices=["minmax", "percentile"],
+        default="minmax",
+        help="How to find the DN range when -dnmin/-dnmax are not given: the image "
+        "min/max (default) or its 0.5/99.5 percentiles, which ignore hot pixels",
+    )
     parser.add_argument(
         "--silent",
         action="store_false",
         help="If used, no output will be printed during execution.",
     )
+    parser.add_argument(
+        "--png-compress-level",
+        type=int,
+        choices=range(10),
+        metavar="{0-9}",
+        help="zlib compression level for png output, default is 3",
+    )
+    parser.add_argument(
+        "--palette",
+        action="store_true",
+        help="Quantize color images to a 256 color palette for smaller png/tif files",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of files to convert in parallel, default is 1",
+    )
     args: argparse.Namespace = parser.parse_args()
+    setup_logging()
 
-    source: Path = Path(args.source).resolve()
+    sources: List[Path] = [Path(source).resolve() for source in args.source]
     outpath: Optional[Path] = None
     if args.out:
         outpath = Path(args.out).resolve()
+        if len(sources) > 1 and not outpath.is_dir():
+            parser.error("--out must be a directory when converting multiple files")
 
-    vic2png(
-        source,
+    convert = partial(
+        vic2png,
         out=outpath,
         fmt=args.format,
         dnmin=args.dnmin,
         dnmax=args.dnmax,
         verbose=args.silent,
+        png_compress_level=args.png_compress_level,
+        palette=args.palette,
+        autoscale=args.autoscale,
+        # Each worker process converts a whole file, so rescale on one thread there
+        threads=1 if args.workers > 1 and len(sources) > 1 else None,
     )
+    if args.workers > 1 and len(sources) > 1:
+        # Convert files in separate processes so reading, quantizing and encoding
+        # of different files can overlap across cores
+        with ProcessPoolExecutor(
+            max_workers=args.workers, initializer=setup_logging
+        ) as executor:
+            list(executor.map(convert, sources))
+    else:
+        for source in sources:
+            convert(source)
@@ -26,17 +26,21 @@ LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
 OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from enum import Enum
+import logging
 import numpy as np
 from pathlib import Path
 import pvl
 import numpy.typing as npt
-from typing import Dict, Tuple
+import re
+from typing import Any, BinaryIO, Dict, FrozenSet, Mapping, Tuple, Union
 
 
+logger = logging.getLogger(__name__)
+
 ODL_DTYPE_MAPPING: Dict[str, str] = {
-    "IEEE_REAL": "float",
+    "IEEE_REAL": ">f",
     "MSB_INTEGER": ">i",
     "LSB_INTEGER": "<i",
     "UNSIGNED_INTEGER": ">u",
@@ -54,8 +58,40 @@ VICAR_DTYPE_MAPPING: Dict[str, str] = {
     "LONG": "i4",
 }
 
+# numpy dtypes for every supported (SAMPLE_TYPE, SAMPLE_BITS) pair of a PDS3 label
+ODL_DTYPES: Dict[Tuple[str, int], np.dtype] = {
+    (samp_type, bits): np.dtype(f"{prefix}{bits // 8}")
+    for samp_type, prefix in ODL_DTYPE_MAPPING.items()
+    for bits in (8, 16, 32, 64)
+    if not (prefix.endswith("f") and bits == 8)
+}
+
+# numpy dtypes for every supported (FORMAT, INTFMT) pair of a Vicar integer label and
+# (FORMAT, REALFMT) pair of a Vicar floating point label
+VICAR_DTYPES: Dict[Tuple[str, str], np.dtype] = {
+    (vicar_format, byte_order): np.dtype(f"{prefix}{dtype_name}")
+    for vicar_format, dtype_name in VICAR_DTYPE_MAPPING.items()
+    for byte_order, prefix in (
+        (("LOW", "<"), ("HIGH", ">"))
+        if np.dtype(dtype_name).kind in ("i", "u")
+        else (("RIEEE", "<"), ("IEEE", ">"))
+    )
+}
+
 VICAR_HEADER_SIZE = 40
 VICAR_LABEL_PREFIX = b"LBLSIZE="
+# Matches a single KEY=VALUE item in a Vicar label, optionally with spaces around
+# the '=', where the value is either a quoted string (with '' as an escaped quote)
+# or a run of non-whitespace
+VICAR_ITEM_PATTERN = re.compile(rb"(\w+)\s*=\s*(?:'((?:[^']|'')*)'|(\S+))")
+# The system label is always first, and ends where the property/history labels begin
+VICAR_SYSTEM_LABEL_END: FrozenSet[str] = frozenset({"PROPERTY", "TASK"})
+# System label items that must be present to locate and read the raster
+VICAR_REQUIRED_ITEMS: Tuple[str, ...] = ("LBLSIZE", "FORMAT", "ORG", "N1", "N2", "N3")
+
+ODL_HEADER_SIZE = 4096
+ODL_RECORD_BYTES_PATTERN = re.compile(rb"^\s*RECORD_BYTES\s*=\s*(\d+)", re.MULTILINE)
+ODL_LABEL_RECORDS_PATTERN = re.compile(rb"^\s*LABEL_RECORDS\s*=\s*(\d+)", re.MULTILINE)
 
 
 class UnsupportedFileTypeError(Exception):
@@ -123,8 +159,8 @@ def get_odl_imageparms(label: pvl.PVLModule) -> ImageParms:
             vicar_bytes = label.get("IMAGE_HEADER").get("BYTES")
             lblsize += int(vicar_bytes)
         except (AttributeError, TypeError):
-            print(
-                "Warning: unable to read Vicar label information despite IMAGE_HEADER"
+            logger.warning(
+                "unable to read Vicar label information despite IMAGE_HEADER "
                 + "existing. Raster may be inaccurate."
             )
 
@@ -132,11 +168,10 @@ def get_odl_imageparms(label: pvl.PVLModule) -> ImageParms:
 
     """dtype"""
     samp_type = image_label["SAMPLE_TYPE"]
-    samp_bits = int(image_label["SAMPLE_BITS"])
-    dtype_prefix = ODL_DTYPE_MAPPING.get(samp_type)
+    samp_bits = image_label["SAMPLE_BITS"]
     try:
-        dtype = np.dtype(f"{dtype_prefix}{samp_bits // 8}")
-    except TypeError as e:
+        dtype = ODL_DTYPES[(samp_type, samp_bits)]
+    except KeyError as e:
         raise UnsupportedFileTypeError(
             f"file has unknown data type: SAMPLE_TYPE = {samp_type}, "
             + f"SAMPLE_BITS = {samp_bits}"
@@ -158,112 +193,264 @@ def get_odl_imageparms(label: pvl.PVLModule) -> ImageParms:
     return ImageParms(lblsize, dtype, shape, org)
 
 
-def get_vicar_imageparms(label: pvl.PVLModule) -> ImageParms:
-    """Determine the parameters needed to read a raster from a Vicar image."""
+@dataclass(frozen=True)
+class VicarHeader:
+    """Vicar system label items needed to read the raster.
 
-    """lblsize"""
-    lblsize = int(label["LBLSIZE"])
+    lblsize: Size of the label in bytes
+    format: Pixel data type (BYTE, HALF, FULL, REAL, ...)
+    type: Type of the file, only IMAGE is supported
+    org: Band organization of the data (BSQ, BIP, or BIL)
+    n1, n2, n3: Size of the fastest, middle and slowest varying dimensions
+    nlb, nbb: Number of binary header lines and binary prefix bytes per record
+    intfmt: Integer byte order (LOW or HIGH)
+    realfmt: Floating point format (IEEE, RIEEE or VAX)
+    """
 
-    """dtype"""
-    dtype_name = VICAR_DTYPE_MAPPING[label["FORMAT"]]
-    kind = np.dtype(dtype_name).kind
-    if kind in ("i", "u"):
-        intfmt = label.get("INTFMT", "LOW")
-        itemsize = np.dtype(dtype_name).itemsize
-        if intfmt == "LOW" and itemsize > 1:
-            dtype = np.dtype(f"<{dtype_name}")
-        elif itemsize > 1:
-            dtype = np.dtype(f">{dtype_name}")
-        else:
-            dtype = np.dtype(dtype_name)
-    else:
-        realfmt = label.get("REALFMT", "IEEE")
-        if realfmt == "IEEE":
-            dtype = np.dtype(f">{dtype_name}")
-        elif realfmt == "RIEEE":
-            dtype = np.dtype(f"<{dtype_name}")
+    lblsize: int
+    format: str
+    type: str
+    org: str
+    n1: int
+    n2: int
+    n3: int
+    nlb: int = 0
+    nbb: int = 0
+    intfmt: str = "LOW"
+    realfmt: str = "IEEE"
+
+    @classmethod
+    def from_label(cls, label: Mapping[str, Any]) -> "VicarHeader":
+        """Create a VicarHeader from a parsed Vicar label.
+
+        :param label: Mapping of Vicar label keywords to values
+        :return: VicarHeader with typed system label items
+        """
+        missing = [key for key in VICAR_REQUIRED_ITEMS if key not in label]
+        if missing:
+            raise UnsupportedFileTypeError(
+                f"Vicar label is missing required items: {', '.join(missing)}"
+            )
+        return cls(
+            lblsize=int(label["LBLSIZE"]),
+            format=label["FORMAT"],
+            type=label.get("TYPE", ""),
+            org=label["ORG"],
+            n1=int(label["N1"]),
+            n2=int(label["N2"]),
+            n3=int(label["N3"]),
+            nlb=int(label.get("NLB", 0)),
+            nbb=int(label.get("NBB", 0)),
+            intfmt=label.get("INTFMT", "LOW"),
+            realfmt=label.get("REALFMT", "IEEE"),
+        )
+
+
+# Vicar system label keywords read into each VicarHeader field, with the field's type
+VICAR_HEADER_ITEMS: Dict[str, Tuple[str, Any]] = {
+    field.name.upper(): (field.name, field.type) for field in fields(VicarHeader)
+}
+
+
+def parse_vicar_system_label(header: bytes) -> VicarHeader:
+    """
+    Read the items of a Vicar system label needed to read the raster straight into a
+    VicarHeader, without running a full PVL parse.
+
+    :param header: Raw bytes of the Vicar label.
+    :return: VicarHeader with typed system label items
+    """
+    items: Dict[str, Any] = {}
+    for match in VICAR_ITEM_PATTERN.finditer(header):
+        key = match.group(1).decode("ascii")
+        if key in VICAR_SYSTEM_LABEL_END:
+            break
+        item = VICAR_HEADER_ITEMS.get(key)
+        if item is None:
+            continue
+        name, item_type = item
+        quoted, unquoted = match.group(2), match.group(3)
+        if quoted is not None:
+            value = quoted.replace(b"''", b"'").decode("ascii", errors="replace")
         else:
+            value = unquoted.decode("ascii", errors="replace")
+        try:
+            items[name] = item_type(value)
+        except ValueError as e:
             raise UnsupportedFileTypeError(
-                f"VAX floating point is not supported: REALFMT = {realfmt}"
+                f"Vicar label item is not valid: {key} = {value}"
+            ) from e
+    missing = [key for key in VICAR_REQUIRED_ITEMS if key.lower() not in items]
+    if missing:
+        raise UnsupportedFileTypeError(
+            f"Vicar label is missing required items: {', '.join(missing)}"
+        )
+    # TYPE is not needed to read the raster, so default it like from_label does
+    return VicarHeader(**{"type": "", **items})
+
+
+def get_vicar_imageparms(
+    label: Union[VicarHeader, Mapping[str, Any]],
+) -> ImageParms:
+    """Determine the parameters needed to read a raster from a Vicar image."""
+    header = label if isinstance(label, VicarHeader) else VicarHeader.from_label(label)
+
+    """dtype"""
+    # Integer formats are keyed by INTFMT and floating point formats by REALFMT, so
+    # at most one of these lookups can succeed
+    dtype = VICAR_DTYPES.get((header.format, header.intfmt))
+    if dtype is None:
+        dtype = VICAR_DTYPES.get((header.format, header.realfmt))
+    if dtype is None:
+        if (header.format, "IEEE") in VICAR_DTYPES:
+            raise UnsupportedFileTypeError(
+                f"VAX floating point is not supported: REALFMT = {header.realfmt}"
             )
+        raise UnsupportedFileTypeError(
+            f"file has unknown data type: FORMAT = {header.format}, "
+            + f"INTFMT = {header.intfmt}, REALFMT = {header.realfmt}"
+        )
 
     """shape"""
-    nlines = label["N2"]
-    nsamps = label["N1"]
-    nbands = label["N3"]
     try:
-        org = BandOrg(label["ORG"])
+        org = BandOrg(header.org)
     except ValueError as e:
         raise UnsupportedFileTypeError(
-            f"File has unknown band organization: {label['ORG']}"
+            f"File has unknown band organization: {header.org}"
         ) from e
-    shape = org.get_shape_order(nlines, nsamps, nbands)
+    shape = org.get_shape_order(header.n2, header.n1, header.n3)
 
     # Check some additional label items to make sure the file is supported
-    if int(label.get("NLB", 0)) != 0 or int(label.get("NBB", 0)) != 0:
+    if header.nlb != 0 or header.nbb != 0:
         raise UnsupportedFileTypeError(
             "Vicar file contains a binary header, this is not currently supported."
         )
-    if label.get("TYPE") != "IMAGE":
+    if header.type != "IMAGE":
         raise UnsupportedFileTypeError(
             "Vicar file is not an image, this is not currently supported."
         )
 
-    return ImageParms(lblsize, dtype, shape, org)
+    return ImageParms(header.lblsize, dtype, shape, org)
 
 
-def read_vic(filepath: Path) -> Tuple[pvl.PVLModule, np.ndarray]:
+def read_label(
+    f: BinaryIO, full_label: bool = True
+) -> Tuple[Union[pvl.PVLModule, VicarHeader], ImageParms]:
     """
-    Read a Vicar of PDS3 format raster file.
-
-    :params filepath: Path to the image raster.
-    :return: A tuple[label, image_data] where label is a PVLModule containing the
-        parsed metadata label and image_data is a numpy array of
-        shape (lines, samples, bands)
+    Read and parse the label at the start of an open Vicar or PDS3 file.
+
+    :params f: File opened in binary mode, positioned anywhere.
+    :params full_label: If False, a Vicar label is not parsed with PVL and the
+        returned label is a VicarHeader of the system label items needed to read
+        the raster.
+    :return: A tuple[label, parms] of the parsed label and the parameters needed to
+        read the raster following it.
     """
     # Read the label using PVL, this will parse the ODL label, if available,
     # otherwise it will parse the Vicar label
     # Read 40 bytes to detect if this is a Vicar label only
-    is_vicar = False
-    with open(filepath, "rb") as f:
-        header = f.read(VICAR_HEADER_SIZE)
-        if header[0:8] == VICAR_LABEL_PREFIX:
-            iblank = header.index(b" ", 8)
-            lblsize = int(header[8:iblank])
-            f.seek(0)
-            vicar_header = f.read(lblsize).rstrip(b"\0")
-            is_vicar = True
-
-    if is_vicar:
-        # Using this method ensures that PVL will not run into trouble tokenizing
-        # the Vicar label
+    f.seek(0)
+    header = f.read(VICAR_HEADER_SIZE)
+    if header[0:8] == VICAR_LABEL_PREFIX:
+        iblank = header.index(b" ", 8)
+        lblsize = int(header[8:iblank])
+        f.seek(0)
+        vicar_header = f.read(lblsize).rstrip(b"\0")
+        if not full_label:
+            system_label = parse_vicar_system_label(vicar_header)
+            return (system_label, get_vicar_imageparms(system_label))
+        # Using this method ensures that PVL will not run into trouble
+        # tokenizing the Vicar label
         label = pvl.loads(vicar_header)
-        parms = get_vicar_imageparms(label)
-    else:
-        with open(filepath, "r") as f:
-            try:
-                label = pvl.load(f)
-            except Exception as e:
-                raise UnsupportedFileTypeError(
-                    "unsupported file type encountered, only VIC or IMG are allowed."
-                ) from e
-        if label.get("ODL_VERSION_ID") is not None:
-            parms = get_odl_imageparms(label)
-        else:
-            raise UnsupportedFileTypeError(
-                "unsupported file type encountered, only VIC or IMG are allowed."
-            )
-
-    with open(filepath, "rb") as f:
-        f.seek(parms.lblsize)
-        # Handles EOL label edge case
-        raster_bytes = f.read(
-            parms.dtype.itemsize * parms.shape[0] * parms.shape[1] * parms.shape[2]
+        return (label, get_vicar_imageparms(label))
+
+    # Size the PDS3 label from its first few KB so that only the label, and none of
+    # the raster following it, is read and tokenized
+    f.seek(0)
+    header = f.read(ODL_HEADER_SIZE)
+    record_bytes = ODL_RECORD_BYTES_PATTERN.search(header)
+    label_records = ODL_LABEL_RECORDS_PATTERN.search(header)
+    odl_header = b""
+    if record_bytes is not None and label_records is not None:
+        f.seek(0)
+        odl_header = f.read(int(record_bytes.group(1)) * int(label_records.group(1)))
+    try:
+        label = pvl.loads(odl_header.decode("ascii", errors="replace"))
+    except Exception as e:
+        raise UnsupportedFileTypeError(
+            "unsupported file type encountered, only VIC or IMG are allowed."
+        ) from e
+    if label.get("ODL_VERSION_ID") is None:
+        raise UnsupportedFileTypeError(
+            "unsupported file type encountered, only VIC or IMG are allowed."
         )
-        pixel_data = np.frombuffer(raster_bytes, dtype=parms.dtype)
+    return (label, get_odl_imageparms(label))
+
+
+def read_raster(f: BinaryIO, parms: ImageParms, use_memmap: bool = True) -> np.ndarray:
+    """
+    Read the raster of an open Vicar or PDS3 file in its stored organization.
 
+    :params f: File opened in binary mode.
+    :params parms: Parameters describing where and how the raster is stored.
+    :params use_memmap: If True, memory-map the raster instead of reading it.
+    :return: A numpy array of shape parms.shape
+    """
+    if use_memmap:
+        # Map the raster rather than reading it so pages are only pulled in from
+        # disk as they are touched, and no intermediate bytes copy is made
+        raw_data: np.ndarray = np.memmap(
+            f,
+            dtype=parms.dtype,
+            mode="r",
+            offset=parms.lblsize,
+            shape=parms.shape,
+        )
+        return raw_data
+    f.seek(parms.lblsize)
+    # Handles EOL label edge case
+    raster_bytes = f.read(
+        parms.dtype.itemsize * parms.shape[0] * parms.shape[1] * parms.shape[2]
+    )
+    pixel_data = np.frombuffer(raster_bytes, dtype=parms.dtype)
     # shape pixel stream into 3d array according to the label
-    raw_data = pixel_data.reshape(parms.shape)
+    return pixel_data.reshape(parms.shape)
+
+
+def read_vic(
+    filepath: Path,
+    use_memmap: bool = True,
+    full_label: bool = True,
+    native: bool = True,
+) -> Tuple[Union[pvl.PVLModule, VicarHeader], np.ndarray]:
+    """
+    Read a Vicar of PDS3 format raster file.
+
+    :params filepath: Path to the image raster.
+    :params use_memmap: If True, memory-map the raster instead of reading it into
+        memory. Non-native byte order rasters are still copied when swapped.
+    :params full_label: If False, a Vicar label is not parsed with PVL and the
+        returned label is a VicarHeader of the system label items needed to read
+        the raster. Has no effect on PDS3 files.
+    :params native: If True, non-native (e.g. big-endian) rasters are swapped into
+        native byte order, which copies them. If False, they are returned in their
+        stored byte order so that a memory-mapped raster stays mapped and numpy
+        swaps values as they are used.
+    :return: A tuple[label, image_data] where label is a PVLModule containing the
+        parsed metadata label (or a VicarHeader, see full_label) and image_data is a
+        numpy array of shape (lines, samples, bands), or (lines, samples) for a
+        single band raster
+    """
+    # Open the file once, and read both the label and the raster through it
+    with open(filepath, "rb") as f:
+        label, parms = read_label(f, full_label)
+        raw_data = read_raster(f, parms, use_memmap)
+
+    # Swap non-native (e.g. big-endian) rasters into native byte order for callers
+    # that need it
+    if native and not raw_data.dtype.isnative:
+        raw_data = raw_data.byteswap().view(raw_data.dtype.newbyteorder("="))
+
     # Transpose the data to (line, sample, band) organization if it isn't already
     if parms.org == BandOrg.BSQ:
         image_data = np.transpose(raw_data, (1, 2, 0))
@@ -271,5 +458,9 @@ def read_vic(filepath: Path) -> Tuple[pvl.PVLModule, np.ndarray]:
         image_data = np.transpose(raw_data, (0, 2, 1))
     else:
         image_data = raw_data
+    # A single band is contiguous in (line, sample) order regardless of the
+    # organization, so return it as a 2D array
+    if image_data.shape[2] == 1:
+        image_data = image_data[:, :, 0]
 
     return (label, image_data)
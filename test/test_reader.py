@@ -1,12 +1,17 @@
 # tests/test_reader.py
+from dataclasses import replace
 import numpy as np
 import os
 import pvl
 import pytest
 from vic2png.reader import (
     read_vic,
+    get_odl_imageparms,
+    get_vicar_imageparms,
+    parse_vicar_system_label,
     BandOrg,
     UnsupportedFileTypeError,
+    VicarHeader,
 )
 
 
@@ -35,3 +40,136 @@ def test_organization_enum():
 
     with pytest.raises(UnsupportedFileTypeError):
         BandOrg.from_pds3("INVALID")
+
+
+def test_read_vic_native_byteorder(img_file):
+    """Test that big-endian rasters are returned in native byte order."""
+    _, data = read_vic(img_file)
+    assert data.dtype.isnative
+    assert data.dtype == np.int16
+
+
+def test_read_vic_stored_byteorder(img_file):
+    """Test that rasters can be left mapped in their stored byte order."""
+    _, data = read_vic(img_file, native=False)
+    _, reference = read_vic(img_file)
+    assert data.dtype == np.dtype(">i2")
+    assert isinstance(data.base, np.memmap)
+    assert np.array_equal(data, reference)
+
+
+@pytest.mark.parametrize("use_memmap", [True, False])
+def test_read_vic_memmap(vic_file, img_file, use_memmap):
+    """Test that memory-mapped and fully read rasters are identical."""
+    for path in (vic_file, img_file):
+        _, data = read_vic(path, use_memmap=use_memmap)
+        _, reference = read_vic(path, use_memmap=not use_memmap)
+        assert np.array_equal(data, reference)
+
+
+def test_read_vic_system_label(vic_file):
+    """Test that the minimal Vicar label parse agrees with the full PVL parse."""
+    label, data = read_vic(vic_file)
+    system_label, system_data = read_vic(vic_file, full_label=False)
+    assert isinstance(system_label, VicarHeader)
+    assert system_label == VicarHeader.from_label(label)
+    assert np.array_equal(data, system_data)
+
+
+def test_parse_vicar_system_label():
+    """Test scanning Vicar label items, with or without spaces around the '='."""
+    header = parse_vicar_system_label(
+        b"LBLSIZE=100  FORMAT = 'HALF' NOTE='it''s ORG=BIL' ORG= BSQ N1=4 N2 =3 N3=1"
+        b" PROPERTY='X' NLB=2"
+    )
+    assert header == VicarHeader(
+        lblsize=100, format="HALF", type="", org="BSQ", n1=4, n2=3, n3=1
+    )
+
+    with pytest.raises(UnsupportedFileTypeError, match="missing required items: N3"):
+        parse_vicar_system_label(b"LBLSIZE=100 FORMAT='HALF' ORG='BSQ' N1=4 N2=3")
+
+    with pytest.raises(UnsupportedFileTypeError, match="missing required items: ORG"):
+        get_vicar_imageparms(
+            {"LBLSIZE": 100, "FORMAT": "HALF", "N1": 4, "N2": 3, "N3": 1}
+        )
+
+
+def test_read_vic_single_band(vic_file_bw):
+    """Test that a single band raster is returned as a contiguous 2D array."""
+    _, data = read_vic(vic_file_bw)
+    assert data.shape == (336, 1280)
+    assert data.flags["C_CONTIGUOUS"]
+
+
+@pytest.mark.parametrize(
+    "fmt,intfmt,realfmt,dtype",
+    [
+        ("BYTE", "HIGH", "VAX", "u1"),
+        ("HALF", "LOW", "VAX", "<i2"),
+        ("FULL", "HIGH", "IEEE", ">i4"),
+        ("REAL", "LOW", "IEEE", ">f4"),
+        ("DOUB", "HIGH", "RIEEE", "<f8"),
+    ],
+)
+def test_vicar_dtype(fmt, intfmt, realfmt, dtype):
+    """Test Vicar FORMAT/INTFMT/REALFMT to dtype conversion."""
+    label = {
+        "LBLSIZE": 100,
+        "FORMAT": fmt,
+        "INTFMT": intfmt,
+        "REALFMT": realfmt,
+        "TYPE": "IMAGE",
+        "ORG": "BSQ",
+        "N1": 4,
+        "N2": 3,
+        "N3": 1,
+    }
+    assert get_vicar_imageparms(label).dtype == np.dtype(dtype)
+
+    label["REALFMT"] = "VAX"
+    if np.dtype(dtype).kind == "f":
+        with pytest.raises(UnsupportedFileTypeError, match="VAX"):
+            get_vicar_imageparms(label)
+
+
+@pytest.mark.parametrize(
+    "samp_type,samp_bits,dtype",
+    [
+        ("IEEE_REAL", 32, ">f4"),
+        ("MSB_INTEGER", 16, ">i2"),
+        ("LSB_INTEGER", 16, "<i2"),
+        ("UNSIGNED_INTEGER", 8, "u1"),
+    ],
+)
+def test_odl_dtype(samp_type, samp_bits, dtype):
+    """Test PDS3 SAMPLE_TYPE/SAMPLE_BITS to dtype conversion."""
+    label = {
+        "RECORD_BYTES": 100,
+        "LABEL_RECORDS": 1,
+        "IMAGE": {
+            "SAMPLE_TYPE": samp_type,
+            "SAMPLE_BITS": samp_bits,
+            "LINES": 3,
+            "LINE_SAMPLES": 4,
+            "BANDS": 1,
+        },
+    }
+    assert get_odl_imageparms(label).dtype == np.dtype(dtype)
+
+    label["IMAGE"]["SAMPLE_BITS"] = 12
+    with pytest.raises(UnsupportedFileTypeError, match="unknown data type"):
+        get_odl_imageparms(label)
+
+
+def test_vicar_header():
+    """Test reading image parameters from a VicarHeader."""
+    header = VicarHeader(
+        lblsize=100, format="HALF", type="IMAGE", org="BIL", n1=4, n2=3, n3=2
+    )
+    parms = get_vicar_imageparms(header)
+    assert parms.shape == (3, 2, 4)
+    assert parms.org == BandOrg.BIL
+
+    with pytest.raises(UnsupportedFileTypeError, match="binary header"):
+        get_vicar_imageparms(replace(header, nlb=1))
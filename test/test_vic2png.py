@@ -3,7 +3,15 @@ import os
 from pathlib import Path
 from PIL import Image
 import pytest
-from vic2png import vic2png
+from vic2png import vic2png, vic2png_many
+from vic2png import convert
+from vic2png.convert import (
+    get_minmax,
+    get_percentile_range,
+    make_quantizer,
+    quantize_vimg,
+    validate_dn_range,
+)
 
 """
 These tests are not intended to determine whether the png looks as expected,
@@ -81,6 +89,18 @@ def test_vic2tif(vic_file, reference_images):
     os.remove(out_tif)
 
 
+def test_png_save_options(vic_file, tmp_path):
+    """Test that the png compression level and palette options are applied"""
+    out_fast = vic2png(vic_file, out=tmp_path / "fast.png", png_compress_level=0)
+    out_small = vic2png(vic_file, out=tmp_path / "small.png", png_compress_level=9)
+    assert out_fast.stat().st_size > out_small.stat().st_size
+    out_palette = vic2png(vic_file, out=tmp_path / "palette.png", palette=True)
+    with Image.open(out_palette) as img:
+        assert img.mode == "P"
+    for out_path in (out_fast, out_small, out_palette):
+        os.remove(out_path)
+
+
 def test_img2png(img_file, reference_images):
     out_png = vic2png(img_file)
     assert out_png.exists()
@@ -105,3 +125,193 @@ def test_invalid_dnrange(vic_file):
     """Test handling of invalid DN range"""
     with pytest.raises(ValueError, match="dn min is greater than dn max"):
         vic2png(vic_file, dnmin=100, dnmax=50)
+
+
+def test_validate_dn_range():
+    """Test that provided DN limits are clipped to the integer data range"""
+    assert validate_dn_range(-5, 9000, 3, 7, np.dtype(np.int16)) == (0, 4095)
+    assert validate_dn_range(None, 50, 3, None, np.dtype(np.uint8)) == (3, 50)
+    assert validate_dn_range(-5.0, None, None, 7.0, np.dtype(">f4")) == (-5.0, 7.0)
+
+
+def test_constant_image():
+    """Test that an image with a single DN value converts without dividing by 0"""
+    vimg = np.full((4, 5), 42, dtype=np.int16)
+    dnmin, dnmax = validate_dn_range(None, None, 42, 42, vimg.dtype)
+    assert quantize_vimg(vimg, dnmin, dnmax).tolist() == np.zeros((4, 5)).tolist()
+    assert quantize_vimg(vimg, 0, 0).tolist() == np.full((4, 5), 255).tolist()
+
+
+def test_quantize_clips_dn_range():
+    """Test that data outside of the DN range is clipped rather than wrapped"""
+    vimg = np.array([[[0], [100], [150], [200], [300]]], dtype=np.int16)
+    arr_bytes = quantize_vimg(vimg, 100, 200)
+    assert arr_bytes.dtype == np.uint8
+    assert arr_bytes.ravel().tolist() == [0, 0, 127, 255, 255]
+
+
+@pytest.mark.parametrize("dnmin, dnmax", [(10, 100), (-10, 300), (10.5, 99.5)])
+def test_rescale_clip_bounds(dnmin, dnmax):
+    """Test rescaling with DN ranges inside and outside of the data type's range"""
+    vimg = np.arange(256, dtype=np.uint8).reshape(16, 16)
+    expected = (vimg.astype(np.float64) - dnmin) * 255 / (dnmax - dnmin)
+    expected = np.clip(expected, 0, 255).astype(np.uint8)
+    assert np.array_equal(quantize_vimg(vimg, dnmin, dnmax), expected)
+
+
+@pytest.mark.parametrize(
+    "vimg",
+    [
+        np.array([16777217, 16777218, 16777219], dtype=np.int32),
+        np.linspace(806.3821636961687, 806.3829269786713, 9),
+    ],
+)
+def test_quantize_rounded_range_does_not_wrap(vimg):
+    """Test that DN ranges that round in float32 don't push dnmax past 255"""
+    arr_bytes = quantize_vimg(vimg, vimg.min(), vimg.max())
+    assert arr_bytes[0] == 0
+    assert arr_bytes[-1] == 255
+    assert np.all(np.diff(arr_bytes.astype(int)) >= 0)
+
+
+@pytest.mark.parametrize(
+    "vimg",
+    [
+        np.linspace(1000.0001, 1000.0002, 11),
+        np.linspace(50_000_000, 50_000_010, 11).astype(np.int32),
+    ],
+)
+def test_quantize_keeps_precision(vimg):
+    """Test that a narrow range at a large offset keeps all of its levels"""
+    expected = (vimg - vimg.min()) * 255 / (vimg.max() - vimg.min())
+    arr_bytes = quantize_vimg(vimg, vimg.min(), vimg.max())
+    assert np.all(np.abs(arr_bytes - expected) < 1)
+    assert arr_bytes[-1] == 255
+
+
+def test_quantize_float_input():
+    """Test that floating point data with negative values quantizes correctly"""
+    vimg = np.array([[[-1.0], [-0.5], [0.0], [0.5], [1.0]]], dtype=np.float64)
+    arr_bytes = quantize_vimg(vimg, -1.0, 1.0)
+    assert arr_bytes.ravel().tolist() == [0, 63, 127, 191, 255]
+
+
+def test_quantize_byte_identity():
+    """Test that full range 8-bit data is passed through unchanged"""
+    vimg = np.arange(256, dtype=np.uint8).reshape(16, 16, 1)
+    assert quantize_vimg(vimg, 0, 255) is vimg
+
+
+@pytest.mark.parametrize("dtype", ["u1", "i2", "f4"])
+def test_quantize_out(dtype):
+    """Test that quantize_vimg writes into a provided output buffer"""
+    vimg = np.arange(512 * 4, dtype=dtype).reshape(512, 4) % 200
+    out = np.empty(vimg.shape, dtype=np.uint8)
+    arr_bytes = quantize_vimg(vimg, 10, 190, out=out)
+    assert arr_bytes is out
+    assert np.array_equal(out, quantize_vimg(vimg, 10, 190))
+
+
+def test_get_minmax():
+    """Test that only the requested bounds are computed"""
+    vimg = np.arange(24, dtype=np.int16).reshape(2, 3, 4).transpose(1, 2, 0)
+    assert get_minmax(vimg) == (0, 23)
+    assert get_minmax(vimg, need_min=False) == (None, 23)
+    assert get_minmax(vimg, need_max=False) == (0, None)
+
+
+def test_rescale_threads(monkeypatch):
+    """Test that rescaling in multiple threads matches a single thread"""
+    vimg = np.random.default_rng(0).random((101, 64, 3), dtype=np.float32) * 4000
+    expected = quantize_vimg(vimg, 100, 3000)
+    monkeypatch.setattr(convert, "RESCALE_THREADS", 4)
+    monkeypatch.setattr(convert, "RESCALE_THREAD_PIXELS", 1000)
+    assert np.array_equal(quantize_vimg(vimg, 100, 3000), expected)
+
+
+def test_rescale_single_thread(monkeypatch):
+    """Test that threads=1 rescales a large raster without a thread pool"""
+    vimg = np.random.default_rng(0).random((101, 64, 3), dtype=np.float32) * 4000
+    expected = quantize_vimg(vimg, 100, 3000)
+    monkeypatch.setattr(convert, "RESCALE_THREADS", 4)
+    monkeypatch.setattr(convert, "RESCALE_THREAD_PIXELS", 1000)
+    monkeypatch.setattr(convert, "ThreadPoolExecutor", None)
+    assert np.array_equal(quantize_vimg(vimg, 100, 3000, threads=1), expected)
+
+
+def test_rescale_band_sequential():
+    """Test that transposed band sequential data rescales like interleaved data"""
+    bsq = np.random.default_rng(0).integers(0, 4096, (3, 40, 50), dtype=np.int16)
+    vimg = np.transpose(bsq, (1, 2, 0))
+    expected = quantize_vimg(np.ascontiguousarray(vimg), 100, 3000)
+    assert np.array_equal(quantize_vimg(vimg, 100, 3000), expected)
+
+
+@pytest.mark.parametrize("dtype", ["u1", "<i2", ">i2", ">u2", "f4"])
+def test_get_percentile_range(dtype):
+    """Test that the histogram percentiles bracket np.percentile's values"""
+    rng = np.random.default_rng(0)
+    vimg = rng.integers(-100 if "i" in dtype else 0, 200, (30, 40, 3))
+    vimg = vimg.astype(dtype)
+    assert get_percentile_range(vimg, 0, 100) == (vimg.min(), vimg.max())
+    lo, hi = get_percentile_range(vimg, 5, 95)
+    plo, phi = np.percentile(vimg, [5, 95])
+    assert np.floor(plo) <= lo <= np.ceil(plo)
+    assert np.floor(phi) <= hi <= np.ceil(phi)
+
+
+def test_autoscale_percentile(vic_file, tmp_path):
+    """Test converting with the percentile autoscale"""
+    out_png = vic2png(vic_file, out=tmp_path / "percentile.png", autoscale="percentile")
+    assert out_png.exists()
+    os.remove(out_png)
+    with pytest.raises(ValueError, match="unsupported autoscale"):
+        vic2png(vic_file, autoscale="median")
+
+
+def test_vic2png_many(vic_file, img_file, reference_images, tmp_path):
+    """Test converting several files at once into an output directory"""
+    out_paths = vic2png_many([vic_file, img_file], tmp_path, workers=2)
+    assert out_paths == [
+        tmp_path / vic_file.with_suffix(".png").name,
+        tmp_path / img_file.with_suffix(".png").name,
+    ]
+    assert compare_images(out_paths[0], reference_images("test_vic"))
+    assert compare_images(out_paths[1], reference_images("test_img"))
+    for out_path in out_paths:
+        os.remove(out_path)
+    with pytest.raises(ValueError, match="out must be a directory"):
+        vic2png_many([vic_file], tmp_path / "missing")
+
+
+def test_make_quantizer_cached():
+    """Test that quantizers are reused for the same data type and DN range"""
+    dtype = np.dtype(np.int16)
+    quantizer = make_quantizer(dtype, 100, 3000)
+    assert make_quantizer(dtype, 100, 3000) is quantizer
+    assert make_quantizer(dtype, 100, 3001) is not quantizer
+    vimg = np.arange(-500, 4500, dtype=dtype).reshape(50, 100)
+    expected = np.clip((vimg - 100.0) * 255 / 2900, 0, 255).astype(np.uint8)
+    assert np.array_equal(quantizer(vimg), expected)
+
+
+def test_unsupported_band_count(vic_file, monkeypatch):
+    """Test that rasters PIL can't represent are rejected before quantizing"""
+    vimg = np.zeros((10, 10, 2), dtype=np.int16)
+    monkeypatch.setattr(convert.reader, "read_vic", lambda *args, **kwargs: ({}, vimg))
+    monkeypatch.setattr(convert, "quantize_vimg", None)
+    with pytest.raises(ValueError, match="unsupported band count"):
+        vic2png(vic_file)
+
+
+def test_vic2png_many_single_thread_rescale(monkeypatch, tmp_path):
+    """Test that batch conversions don't also split each raster across threads"""
+    calls = []
+    monkeypatch.setattr(
+        convert, "vic2png", lambda source, **kwargs: calls.append(kwargs)
+    )
+    vic2png_many(["a.vic", "b.vic"], tmp_path, workers=2)
+    assert [kwargs["threads"] for kwargs in calls] == [1, 1]
+    calls.clear()
+    vic2png_many(["a.vic"], tmp_path, workers=1)
+    assert calls[0]["threads"] is None